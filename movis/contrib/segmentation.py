@@ -2,11 +2,16 @@ from __future__ import annotations
 
 import hashlib
 import sys
+import threading
+import urllib.error
 import urllib.request
+import weakref
 from os import PathLike
 from pathlib import Path
+from typing import Callable, Sequence
 
 import cv2
+import numba
 import numpy as np
 
 from movis.util import to_rgb
@@ -17,6 +22,12 @@ try:
 except ImportError:
     onnxruntime_available = False
 
+try:
+    import blake3
+    blake3_available = True
+except ImportError:
+    blake3_available = False
+
 
 class ChromaKey:
     """An effect that extracts the foreground using the chroma key composition.
@@ -79,32 +90,60 @@ class RobustVideoMatting:
         This effect is useful in areas that generally do not require foreground extraction quality,
         such as presentation videos.
 
+    .. note::
+        To avoid allocating a new frame every time, the effect writes its results into two output buffers
+        in turn. The array returned by ``__call__()`` is therefore overwritten two calls later;
+        copy it if it needs to be retained longer.
+
     Args:
         onnx_file:
             The path to the ONNX file of the model. Download it from https://github.com/PeterL1n/RobustVideoMatting
             and put it in an appropriate location. If None, the default model will be downloaded
             and chached in ``~/.cache/movis``. The default model is ``rvm_mobilenetv3_fp16.onnx``.
+            The precision of inputs and outputs is determined by the model, so FP32 models or
+            INT8 models quantized in the QDQ format (e.g., by ``onnxruntime.quantization.quantize_static()``)
+            can also be used.
         downsample_ratio:
             The downsample ratio to accelerate the inference speed. The default value is 0.25.
         recurrent_state:
             The flag to indicate whether the model uses a reccurent state.
             Enabling this flag tends to improve quality, but may also produce unstable results in some cases.
             The default value is ``True``.
+        providers:
+            The execution providers of onnxruntime in the order of priority.
+            If None, ``CUDAExecutionProvider`` is used when available and ``CPUExecutionProvider`` otherwise.
+        device:
+            The device on which inputs and outputs of the model are placed (e.g., ``cpu`` or ``cuda``).
+            The recurrent state is kept on this device between frames, and only the alpha matte is
+            copied back to the host. If None, it is determined by the primary execution provider.
     """
 
     default_model_url = \
         'https://github.com/PeterL1n/RobustVideoMatting/releases/download/v1.0.0/rvm_mobilenetv3_fp16.onnx'
-    default_md5_digest = 'f8c8ae3ed12f3d6ba09211b58a406a28'
+    default_digest = 'f8c8ae3ed12f3d6ba09211b58a406a28'
+    default_digest_algorithm = 'md5'
+    default_md5_digest = default_digest  # Deprecated alias of ``default_digest``.
+    max_batch_size = 16
 
     def __init__(
             self, onnx_file: str | PathLike | None = None, downsample_ratio: float = 0.25,
-            recurrent_state: bool = True):
+            recurrent_state: bool = True, providers: Sequence[str] | None = None,
+            device: str | None = None):
         if not onnxruntime_available:
             raise ImportError("onnxruntime is not installed")
         self._downsample_ratio = np.array([downsample_ratio], dtype=np.float32)
         self._onnx_file = Path(onnx_file) if onnx_file is not None else None
+        self._onnx_path_str: str | None = None
+        if providers is None:
+            available = onnxruntime.get_available_providers()
+            providers = [p for p in ('CUDAExecutionProvider', 'CPUExecutionProvider') if p in available]
+        self._providers = tuple(providers)
+        self._device = device
         self._session: onnxruntime.InferenceSession | None = None
-        self._state: list[np.ndarray] = [np.zeros([1, 1, 1, 1], dtype=np.float16)] * 4
+        self._io_binding: onnxruntime.IOBinding | None = None
+        self._dtype: type = np.float16
+        self._state: list[np.ndarray | onnxruntime.OrtValue] = [np.zeros([1, 1, 1, 1], dtype=self._dtype)] * 4
+        self._frame_processor: tuple[tuple[int, int, type], Callable[[np.ndarray], np.ndarray]] | None = None
         self._recurrent_state = recurrent_state
 
     @property
@@ -120,51 +159,285 @@ class RobustVideoMatting:
             return -1.0
 
     def __call__(self, prev_frame: np.ndarray, time: float) -> np.ndarray:
+        self._get_session()
+        H, W = prev_frame.shape[:2]
+        key = (H, W, self._dtype)
+        # The frame size is fixed within a stream, so the processor specialized for it is reused.
+        if self._frame_processor is None or self._frame_processor[0] != key:
+            self._frame_processor = (key, _make_frame_processor(H, W, self._dtype, self._run))
+        return self._frame_processor[1](prev_frame)
+
+    def call_batch(self, frames: np.ndarray) -> np.ndarray:
+        """Extract the foreground from multiple frames at once.
+
+        If ``recurrent_state=False``, the frames are split into mini-batches of up to ``max_batch_size`` frames
+        and each mini-batch is processed with a single inference call.
+        Otherwise, the frames are processed one by one in the given order so that the recurrent state
+        is carried over to the next frame; only the pre- and post-processing are shared in this case.
+
+        Args:
+            frames:
+                A ``numpy.ndarray`` of shape ``(N, H, W, C)`` with ``dtype=numpy.uint8``,
+                where ``C`` is 3 (RGB) or 4 (RGBA).
+
+        Returns:
+            ``numpy.ndarray`` of shape ``(N, H, W, 4)`` with RGBA order and dtype as ``numpy.uint8``.
+        """
+        assert frames.ndim == 4, "frames must have 4 dimensions (N, H, W, C)"
+        self._get_session()
+        N, H, W = frames.shape[:3]
+        img = _to_nchw(frames, np.empty((N, 3, H, W), dtype=self._dtype))
+        dst = np.empty((N, H, W, 4), dtype=np.uint8)
+        dst[..., :3] = frames[..., :3]
+        batch_size = 1 if self._recurrent_state else self.max_batch_size
+        for i in range(0, N, batch_size):
+            alpha = self._run(img[i:(i + batch_size)])
+            _alpha_to_uint8(alpha[:, 0], dst[i:(i + batch_size), :, :, 3])
+        return dst
+
+    def _get_session(self) -> onnxruntime.InferenceSession:
         if not onnxruntime_available:
             raise ImportError("onnxruntime is not installed")
         if self._session is None:
             if self._onnx_file is None:
-                self._onnx_file = _download_and_cache(self.default_model_url, self.default_md5_digest)
+                self._onnx_file = _download_and_cache(
+                    self.default_model_url, self.default_digest, self.default_digest_algorithm)
             else:
                 self._onnx_file = Path(self._onnx_file)
-            self._session = onnxruntime.InferenceSession(str(self._onnx_file))
-
-        img = prev_frame[:, :, :3].transpose(2, 0, 1)[None, :, :, :]
-        img = img.astype(np.float16) / 255
-        s0 = self._state
-        _, alpha, s10, s11, s12, s13 = self._session.run([], {
-            'src': img,
-            'r1i': s0[0], 'r2i': s0[1], 'r3i': s0[2], 'r4i': s0[3],
-            'downsample_ratio': self._downsample_ratio,
-        })
+            self._onnx_path_str = str(self._onnx_file.resolve())
+            session = _get_shared_session(self._onnx_path_str, self._providers)
+            input_types = {i.name: i.type for i in session.get_inputs()}
+            self._dtype = _ort_type_to_numpy(input_types['src'])
+            self._state = [np.zeros([1, 1, 1, 1], dtype=_ort_type_to_numpy(input_types['r1i']))] * 4
+            if self._device is None:
+                cuda = session.get_providers()[0] == 'CUDAExecutionProvider'
+                self._device = 'cuda' if cuda else 'cpu'
+            self._io_binding = session.io_binding()
+            self._session = session
+        return self._session
+
+    def _run(self, img: np.ndarray) -> np.ndarray:
+        session = self._get_session()
+        binding = self._io_binding
+        assert binding is not None and self._device is not None
+        N = len(img)
+        s0 = self._state if N == 1 else [np.repeat(s, N, axis=0) for s in self._state]
+        binding.bind_cpu_input('src', img)
+        binding.bind_cpu_input('downsample_ratio', self._downsample_ratio)
+        for name, s in zip(('r1i', 'r2i', 'r3i', 'r4i'), s0):
+            if isinstance(s, np.ndarray):
+                binding.bind_cpu_input(name, s)
+            else:
+                binding.bind_ortvalue_input(name, s)
+        for name in ('fgr', 'pha', 'r1o', 'r2o', 'r3o', 'r4o'):
+            binding.bind_output(name, self._device)
+        session.run_with_iobinding(binding)
+        _, alpha, s10, s11, s12, s13 = binding.get_outputs()
         if self._recurrent_state:
+            # The outputs are newly allocated on every run, so the state can be swapped without copying.
             self._state = [s10, s11, s12, s13]
-        alpha = np.clip(alpha * 255, 0, 255).astype(np.uint8)[0].transpose(1, 2, 0)
-        dst = np.concatenate([prev_frame[:, :, :3], alpha], axis=2)
+        return alpha.numpy()
+
+
+# Sessions are shared among instances because they are stateless with respect to their inputs;
+# the recurrent state and the I/O binding are kept per instance.
+# Only weak references are kept so that a session is released once no instance uses it.
+_SESSION_CACHE: weakref.WeakValueDictionary[tuple[str, tuple[str, ...]], onnxruntime.InferenceSession] = \
+    weakref.WeakValueDictionary()
+_SESSION_CACHE_LOCK = threading.Lock()
+
+
+def _get_shared_session(onnx_path: str, providers: tuple[str, ...]) -> onnxruntime.InferenceSession:
+    key = (onnx_path, providers)
+    with _SESSION_CACHE_LOCK:
+        session = _SESSION_CACHE.get(key)
+        if session is None:
+            session = onnxruntime.InferenceSession(onnx_path, providers=list(providers))
+            _SESSION_CACHE[key] = session
+        return session
+
+
+_ORT_TYPE_TO_NUMPY: dict[str, type] = {
+    'tensor(float16)': np.float16,
+    'tensor(float)': np.float32,
+    'tensor(double)': np.float64,
+}
+
+
+def _ort_type_to_numpy(ort_type: str) -> type:
+    if ort_type not in _ORT_TYPE_TO_NUMPY:
+        raise ValueError(
+            f"Unsupported input element type of the model: {ort_type}. "
+            f"Supported types are {', '.join(_ORT_TYPE_TO_NUMPY)}.")
+    return _ORT_TYPE_TO_NUMPY[ort_type]
+
+
+def _make_frame_processor(
+    H: int, W: int, dtype: type, run: Callable[[np.ndarray], np.ndarray]
+) -> Callable[[np.ndarray], np.ndarray]:
+    """Return a function that extracts the foreground from ``(H, W, C)`` frames with preallocated buffers.
+
+    All buffers and their views are created here once, so the returned function only converts the frame,
+    runs the model with ``run`` and writes the result. The results are written into two output buffers in turn
+    so that the previous result remains valid for its consumer.
+    """
+    src: np.ndarray = np.empty((1, 3, H, W), dtype=dtype)
+    src_hwc = src[0].transpose(1, 2, 0)
+    scale = src.dtype.type(255)
+    outputs = []
+    for _ in range(2):
+        dst = np.empty((H, W, 4), dtype=np.uint8)
+        outputs.append((dst, dst[:, :, :3], dst[:, :, 3]))
+    index = 0
+
+    def process(frame: np.ndarray) -> np.ndarray:
+        nonlocal index
+        assert frame.shape[:2] == (H, W), f"frame must have the shape of {(H, W)}, but {frame.shape[:2]} is given"
+        rgb = frame[:, :, :3]
+        np.divide(rgb, scale, out=src_hwc)
+        alpha = run(src)
+        index ^= 1
+        dst, dst_rgb, dst_alpha = outputs[index]
+        np.copyto(dst_rgb, rgb)
+        _alpha_to_uint8(alpha[0, 0], dst_alpha)
         return dst
 
+    return process
+
+
+def _to_nchw(frames: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """Convert ``(N, H, W, C)`` uint8 frames into a normalized ``(N, 3, H, W)`` tensor in a single pass."""
+    np.divide(frames[..., :3].transpose(0, 3, 1, 2), out.dtype.type(255), out=out)
+    return out
+
+
+def _alpha_to_uint8(alpha: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """Write ``clip(alpha * 255, 0, 255)`` into the given uint8 array in a single pass."""
+    if alpha.dtype == np.float16:
+        # Half-precision arithmetic is slow in numpy, so the results for all 65536 values are looked up instead.
+        indices = alpha.view(np.uint16)
+        _lookup_kernel(
+            _FP16_TO_UINT8, indices if indices.ndim == 3 else indices[None], out if out.ndim == 3 else out[None])
+    else:
+        _alpha_to_uint8_numpy(alpha, out)
+    return out
+
+
+def _alpha_to_uint8_numpy(alpha: np.ndarray, out: np.ndarray) -> np.ndarray:
+    np.clip(alpha, 0, 1, out=alpha)
+    np.multiply(alpha, 255, out=out, casting='unsafe')
+    return out
+
+
+@numba.njit(cache=True)
+def _lookup_kernel(table: np.ndarray, indices: np.ndarray, out: np.ndarray) -> None:
+    # Not ``parallel=True`` for the same reason as ``movis.imgproc._alpha_composite_normal_kernel``.
+    N, H, W = indices.shape
+    for n in range(N):
+        for i in range(H):
+            for j in range(W):
+                out[n, i, j] = table[indices[n, i, j]]
+
+
+def _make_fp16_to_uint8_table() -> np.ndarray:
+    alpha = np.arange(1 << 16, dtype=np.uint16).view(np.float16)
+    table = np.empty(1 << 16, dtype=np.uint8)
+    with np.errstate(invalid='ignore'):
+        _alpha_to_uint8_numpy(alpha, table)
+    return table
 
-def _download_and_cache(url, expected_md5: str | None = None) -> Path:
+
+_FP16_TO_UINT8 = _make_fp16_to_uint8_table()
+
+
+def _download_and_cache(url, expected_digest: str | None = None, algorithm: str = 'md5') -> Path:
     filename = Path(url).name
     home_dir = Path.home()
     cache_dir = home_dir / ".cache" / "movis"
     cache_dir.mkdir(parents=True, exist_ok=True)
     cache_path = cache_dir / filename
     if cache_path.exists():
-        actual_md5 = _calculate_md5(cache_path)
-        if expected_md5 is None or actual_md5 == expected_md5:
+        if expected_digest is None:
+            # Nothing to verify, so the cached file is used without reading it.
+            return cache_path
+        actual_digest = _calculate_digest(cache_path, algorithm)
+        if actual_digest == expected_digest:
             return cache_path
         else:
-            sys.stderr.write(f"MD5 mismatch: expected {expected_md5}, got {actual_md5}.")
+            sys.stderr.write(f"{algorithm} digest mismatch: expected {expected_digest}, got {actual_digest}.\n")
             sys.stderr.flush()
 
     sys.stderr.write(f'Downloading {filename} from {url}...\n')
     sys.stderr.flush()
-    urllib.request.urlretrieve(url, cache_path)
+    # Download into a partial file first so that an interrupted download can be resumed next time.
+    part_path = cache_path.with_name(filename + '.part')
+    actual_digest = _download_with_resume(url, part_path, algorithm)
+    if expected_digest is not None and actual_digest != expected_digest:
+        # The resumed partial file may have been stale or corrupted, so download it once again from scratch.
+        part_path.unlink()
+        actual_digest = _download_with_resume(url, part_path, algorithm)
+    part_path.replace(cache_path)
+    if expected_digest is not None and actual_digest != expected_digest:
+        sys.stderr.write(f"{algorithm} digest mismatch: expected {expected_digest}, got {actual_digest}.\n")
+        sys.stderr.flush()
     return cache_path
 
 
-def _calculate_md5(file_path: Path) -> str:
-    """Calculate the MD5 hash of a file."""
-    with open(file_path, 'rb') as f:
-        return hashlib.md5(f.read()).hexdigest()
+def _download_with_resume(url: str, dst_path: Path, algorithm: str = 'md5', chunk_size: int = 1 << 20) -> str:
+    """Download a file in chunks, resuming from ``dst_path`` if it exists, and return its digest."""
+    h = _new_hasher(algorithm)
+    offset = dst_path.stat().st_size if dst_path.exists() else 0
+    headers = {'Range': f'bytes={offset}-'} if 0 < offset else {}
+    try:
+        response = urllib.request.urlopen(urllib.request.Request(url, headers=headers))
+    except urllib.error.HTTPError as e:
+        if e.code != 416 or offset == 0:
+            raise
+        # The partial file reaches the end of the remote file. It is complete only if
+        # its size equals the total size given by ``Content-Range: bytes */<total>``.
+        total = e.headers.get('Content-Range', '').rpartition('/')[2]
+        if total.isdigit() and int(total) == offset:
+            return _calculate_digest(dst_path, algorithm)
+        dst_path.unlink()
+        return _download_with_resume(url, dst_path, algorithm, chunk_size)
+    with response:
+        if 0 < offset and response.status == 206:
+            with open(dst_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    h.update(chunk)
+            mode = 'ab'
+        else:
+            # The server does not support range requests, so start over.
+            mode = 'wb'
+        with open(dst_path, mode) as f:
+            for chunk in iter(lambda: response.read(chunk_size), b''):
+                f.write(chunk)
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def _new_hasher(algorithm: str):
+    if algorithm == 'blake3':
+        if not blake3_available:
+            raise ImportError("blake3 is not installed")
+        return blake3.blake3(max_threads=blake3.blake3.AUTO)
+    return hashlib.new(algorithm)
+
+
+def _calculate_digest(file_path: Path, algorithm: str = 'md5', chunk_size: int = 1 << 20) -> str:
+    """Calculate the digest of a file by streaming it in chunks.
+
+    ``algorithm`` is either ``blake3`` (multi-threaded, requires the ``blake3`` package)
+    or any algorithm name supported by ``hashlib`` (e.g., ``md5`` or ``sha256``).
+    """
+    if algorithm == 'blake3':
+        return _new_hasher(algorithm).update_mmap(file_path).hexdigest()
+    with open(file_path, 'rb', buffering=0) as f:
+        if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+            return hashlib.file_digest(f, algorithm).hexdigest()
+        h = _new_hasher(algorithm)
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
+        for n in iter(lambda: f.readinto(buf), 0):
+            h.update(view[:n])
+        return h.hexdigest()
@@ -2,11 +2,14 @@ from __future__ import annotations
 
 import difflib
 import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
 from os import PathLike
 from pathlib import Path
 from typing import Hashable
 
-import librosa
+import numpy as np
+import soundfile as sf
 
 try:
     from pandas import DataFrame
@@ -49,23 +52,20 @@ def make_voicevox_dataframe(audio_dir: str | PathLike) -> "DataFrame":
         raise ImportError("pandas is not installed")
 
     def get_audio_length(filename: str | PathLike) -> float:
-        return librosa.get_duration(path=filename)
-
-    wav_files = sorted(f for f in Path(audio_dir).iterdir() if f.suffix == ".wav")
-    rows = []
-    start_time = 0.0
-    for wav_file in wav_files:
-        duration = get_audio_length(wav_file)
-        end_time = start_time + duration
-        dic = {
-            "start_time": start_time,
-            "end_time": end_time,
-        }
-        rows.append(dic)
-        start_time = end_time
-    frame = DataFrame(rows)
-    frame["audio_file"] = [str(p) for p in wav_files]
-    return frame
+        # Only the header is read, so the audio data is not decoded.
+        return sf.info(str(filename)).duration
+
+    wav_files = _get_paths(audio_dir, ".wav")
+    with ThreadPoolExecutor() as executor:
+        durations = np.fromiter(
+            executor.map(get_audio_length, wav_files), dtype=np.float64, count=len(wav_files))
+    end_times = np.cumsum(durations)
+    start_times = np.concatenate([[0.0], end_times])[:-1]
+    return DataFrame({
+        "start_time": start_times,
+        "end_time": end_times,
+        "audio_file": [str(p) for p in wav_files],
+    })
 
 
 def make_timeline_from_voicevox(
@@ -126,10 +126,6 @@ def make_timeline_from_voicevox(
     if not pandas_available:
         raise ImportError("pandas is not installed")
 
-    def get_paths(src_dir: Path, ext: str) -> list[Path]:
-        src_dir = Path(src_dir)
-        return sorted(f for f in src_dir.iterdir() if f.suffix == ext)
-
     def get_hash_prefix(text):
         text_bytes = text.encode("utf-8")
         sha1_hash = hashlib.sha1(text_bytes)
@@ -137,7 +133,7 @@ def make_timeline_from_voicevox(
         prefix = hashed_text[:6]
         return prefix
 
-    txt_files = get_paths(Path(audio_dir), ".txt")
+    txt_files = _get_paths(audio_dir, ".txt")
     lines = []
     for txt_file in txt_files:
         raw_text = open(txt_file, "r", encoding="utf-8-sig").read()
@@ -228,3 +224,8 @@ def merge_timeline(
             old_idx += 1
             new_idx += 1
     return DataFrame(result)
+
+
+def _get_paths(src_dir: str | PathLike, ext: str) -> list[Path]:
+    with os.scandir(Path(src_dir)) as it:
+        return sorted(Path(e.path) for e in it if e.is_file() and os.path.splitext(e.name)[1] == ext)
@@ -2,6 +2,8 @@ from __future__ import annotations
 
 import tempfile
 import warnings
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import contextmanager
 from os import PathLike
 from pathlib import Path
@@ -62,7 +64,14 @@ class Composition:
         self._name_to_layer: dict[str, LayerItem] = {}
         assert duration > 0, "duration must be positive"
         self._duration = duration
-        self._cache: Cache = Cache(size_limit=1024 * 1024 * 1024)
+        # Rendered frames of the composition and images of its layers are cached separately
+        # so that one kind of entries does not evict the other.
+        self._cache: Cache = Cache(size_limit=512 * 1024 * 1024)
+        self._layer_cache: Cache = Cache(size_limit=512 * 1024 * 1024)
+        self._timings: tuple[int, np.ndarray, np.ndarray, np.ndarray] | None = None
+        self._prev_layer_keys: tuple[Hashable, ...] = ()
+        self._checkpoint: tuple[tuple[Hashable, ...], tuple[int, int, int, int], np.ndarray] | None = None
+        self._bg_frame: tuple[tuple[int, int, int, int], np.ndarray] | None = None
         self._preview_level: int = 1
         assert isinstance(size, tuple) and len(size) == 2, "size must be a tuple of length 2"
         assert size[0] > 0 and size[1] > 0, "size must be positive"
@@ -78,6 +87,21 @@ class Composition:
         """The duration of the composition."""
         return self._duration
 
+    @property
+    def cache_size_mb(self) -> float:
+        """The maximum size of the cache used for rendering (in megabytes).
+
+        Half of the size is used for rendered frames of the composition,
+        and the other half is used for images of the layers."""
+        return (self._cache.size_limit + self._layer_cache.size_limit) / (1024 * 1024)
+
+    @cache_size_mb.setter
+    def cache_size_mb(self, size: float) -> None:
+        assert size > 0, "cache_size_mb must be positive"
+        size_limit = int(size * 1024 * 1024) // 2
+        self._cache.reset('size_limit', size_limit)
+        self._layer_cache.reset('size_limit', size_limit)
+
     @property
     def preview_level(self) -> int:
         """The resolution of the rendering of the composition.
@@ -172,6 +196,8 @@ class Composition:
         if isinstance(value, LayerItem):
             self._layers.append(value)
             self._name_to_layer[key] = value
+            self._timings = None
+            self._checkpoint = None
         elif callable(value):
             self.add_layer(value, name=key)
         else:
@@ -184,14 +210,26 @@ class Composition:
         """Returns a tuple of hashable keys representing the state for each layer at the given time."""
         if time < 0.0 or self.duration <= time:
             return None
-        layer_keys: list[Hashable] = [CacheType.COMPOSITION]
-        for layer_item in self._layers:
-            layer_time = time - layer_item.offset
-            if layer_time < layer_item.start_time or layer_item.end_time <= layer_time:
-                layer_keys.append(None)
-            else:
-                layer_keys.append(layer_item.get_key(time))
-        return tuple(layer_keys)
+        return self._get_layer_keys(time, self._get_active_indices(time))
+
+    def _get_layer_keys(self, time: float, active_indices: np.ndarray) -> tuple[Hashable, ...]:
+        layer_keys: list[Hashable] = [None] * len(self._layers)
+        for i in active_indices:
+            layer_keys[i] = self._layers[i].get_key(time)
+        return tuple([CacheType.COMPOSITION] + layer_keys)
+
+    def _get_active_indices(self, time: float) -> np.ndarray:
+        """Returns the indices of layers whose time range includes the given time."""
+        revision = LayerItem._timing_revision
+        if self._timings is None or self._timings[0] != revision:
+            self._timings = (
+                revision,
+                np.array([layer_item.offset for layer_item in self._layers], dtype=np.float64),
+                np.array([layer_item.start_time for layer_item in self._layers], dtype=np.float64),
+                np.array([layer_item.end_time for layer_item in self._layers], dtype=np.float64))
+        _, offsets, start_times, end_times = self._timings
+        layer_times = time - offsets
+        return np.flatnonzero((start_times <= layer_times) & (layer_times < end_times))
 
     def __repr__(self) -> str:
         return f"Composition(size={self.size}, duration={self.duration}, layers={self._layers!r})"
@@ -316,7 +354,10 @@ class Composition:
         )
         self._layers.append(layer_item)
         self._name_to_layer[name] = layer_item
+        self._timings = None
+        self._checkpoint = None
         self._cache.clear()
+        self._layer_cache.clear()
         return layer_item
 
     def pop_layer(self, name: str) -> LayerItem:
@@ -333,14 +374,20 @@ class Composition:
         index = next(i for i in range(len(self._layers)) if self._layers[i].name == name)
         layer_item = self._layers.pop(index)
         self._name_to_layer.pop(name)
+        self._timings = None
+        self._checkpoint = None
         self._cache.clear()
+        self._layer_cache.clear()
         return layer_item
 
     def clear(self) -> None:
         """Removes all layers from the composition."""
         self._layers.clear()
         self._name_to_layer.clear()
+        self._timings = None
+        self._checkpoint = None
         self._cache.clear()
+        self._layer_cache.clear()
 
     def __call__(
         self, time: float,
@@ -352,7 +399,12 @@ class Composition:
         L = self._preview_level
         current_shape = self.size[1] // L, self.size[0] // L
 
-        key = self.get_key(time)
+        active_indices = self._get_active_indices(time)
+        key = self._get_layer_keys(time, active_indices)
+        layer_keys = key[1:]
+        # The number of bottom layers whose states are unchanged from the previous frame.
+        n_static = _get_common_prefix_length(layer_keys, self._prev_layer_keys)
+        self._prev_layer_keys = layer_keys
         if key in self._cache:
             cached_frame: np.ndarray = self._cache[key]
             if cached_frame.shape[:2] == current_shape:
@@ -360,15 +412,40 @@ class Composition:
             else:
                 del self._cache[key]
 
-        frame = np.empty(current_shape + (4,), dtype=np.uint8)
-        frame[:, :, :] = np.asarray(bg_color, dtype=np.uint8).reshape(1, 1, 4)
-        for layer_item in self._layers:
-            frame = layer_item._composite(
+        # Resume from the checkpoint (i.e., the intermediate frame after compositing the first few layers)
+        # if these layers are in the same state as when the checkpoint was taken.
+        start = 0
+        if self._checkpoint is not None:
+            checkpoint_keys, checkpoint_bg_color, checkpoint_frame = self._checkpoint
+            n = len(checkpoint_keys)
+            if checkpoint_frame.shape[:2] == current_shape and checkpoint_bg_color == bg_color \
+                    and _get_common_prefix_length(layer_keys, checkpoint_keys) == n:
+                start = n
+                frame = checkpoint_frame.copy()
+        if start == 0:
+            frame = self._get_bg_frame(current_shape, bg_color).copy()
+        # Only the layers active at the given time are composited.
+        take_checkpoint = start < n_static
+        for i in active_indices[np.searchsorted(active_indices, start):]:
+            if take_checkpoint and n_static <= i:
+                self._checkpoint = (layer_keys[:n_static], bg_color, frame.copy())
+                take_checkpoint = False
+            frame = self._layers[i]._composite(
                 frame, time, preview_level=self._preview_level,
-                cache=self._cache)
+                cache=self._layer_cache)
         self._cache[key] = frame
         return frame
 
+    def _get_bg_frame(self, shape: tuple[int, int], bg_color: tuple[int, int, int, int]) -> np.ndarray:
+        # Filling a frame with a per-pixel color is much slower than copying a filled one,
+        # so the filled background is kept and copied for every frame.
+        if self._bg_frame is None or self._bg_frame[0] != bg_color or self._bg_frame[1].shape[:2] != shape:
+            bg_frame = np.empty(shape + (4,), dtype=np.uint8)
+            bg_frame[:, :, :] = np.asarray(bg_color, dtype=np.uint8).reshape(1, 1, 4)
+            bg_frame.flags.writeable = False
+            self._bg_frame = (bg_color, bg_frame)
+        return self._bg_frame[1]
+
     def get_audio(self, start_time: float, end_time: float) -> np.ndarray | None:
         """Returns the audio of the composition as a numpy array.
 
@@ -407,10 +484,27 @@ class Composition:
         fps: float, writer: Format.Writer,
     ) -> None:
         times = np.arange(start_time, end_time, 1.0 / fps)
-        for t in tqdm(times, total=len(times)):
-            frame = np.asarray(self(t, bg_color=(0, 0, 0, 255)))
-            writer.append_data(frame)
-        writer.close()
+        # Frames are encoded in a worker thread so that encoding overlaps with rendering the next frames.
+        # The number of frames in flight is bounded to keep memory usage constant.
+        max_pending = 4
+        pending: deque[Future] = deque()
+        try:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                for i, t in enumerate(tqdm(times, total=len(times))):
+                    frame = np.asarray(self(t, bg_color=(0, 0, 0, 255)))
+                    if i == 0:
+                        # The writer starts the ffmpeg subprocess on the first frame. It is written from
+                        # the main thread because forking from other threads is unsafe for some threading
+                        # libraries (e.g., TBB used by numba).
+                        writer.append_data(frame)
+                        continue
+                    if len(pending) >= max_pending:
+                        pending.popleft().result()
+                    pending.append(executor.submit(writer.append_data, frame))
+                while pending:
+                    pending.popleft().result()
+        finally:
+            writer.close()
 
     def write_video(
         self,
@@ -521,7 +615,6 @@ class Composition:
         if end_time is None:
             end_time = self.duration
 
-        times = np.arange(start_time, end_time, 1.0 / fps)
         with tempfile.TemporaryDirectory() as temp_dir:
             temp_file = Path(temp_dir) / "output.mp4"
             with self.preview(level=preview_level):
@@ -531,10 +624,7 @@ class Composition:
                     ffmpeg_params=["-preset", "veryfast"],
                     pixelformat="yuv444p", macro_block_size=None,
                     ffmpeg_log_level="error")
-                for t in tqdm(times, total=len(times)):
-                    frame = np.asarray(self(t, bg_color=(0, 0, 0, 255)))
-                    writer.append_data(frame)
-                writer.close()
+                self._write_video(start_time, end_time, fps, writer)
                 display(Video.from_file(filename, autoplay=True, loop=True))
 
     def write_audio(
@@ -615,6 +705,11 @@ class LayerItem:
             A flag specifying whether the audio is enabled or not;
             if ``audio=False``, the audio of the given layer is not used.
     """
+
+    # Incremented whenever the time range of any layer item changes,
+    # so that compositions can tell when to rebuild their timing arrays.
+    _timing_revision: int = 0
+
     def __init__(
             self, layer: Layer, name: str = 'layer', transform: Transform | None = None,
             offset: float = 0.0, start_time: float = 0.0, end_time: float | None = None,
@@ -622,14 +717,45 @@ class LayerItem:
         self.layer: Layer = layer
         self.name: str = name
         self.transform: Transform = transform if transform is not None else Transform()
-        self.offset: float = offset
-        self.start_time: float = start_time
-        self.end_time: float = end_time if end_time is not None else getattr(layer, "duration", 1e6)
+        self._offset: float = offset
+        self._start_time: float = start_time
+        self._end_time: float = end_time if end_time is not None else getattr(layer, "duration", 1e6)
+        LayerItem._timing_revision += 1
         self.audio_level: Attribute = Attribute(audio_level, AttributeType.SCALAR, range=(-1000, 1000))
         self.visible: bool = visible
         self.audio: bool = audio
         self._effects: list[Effect] = []
 
+    @property
+    def offset(self) -> float:
+        """The starting time of the layer in the composition."""
+        return self._offset
+
+    @offset.setter
+    def offset(self, value: float) -> None:
+        self._offset = value
+        LayerItem._timing_revision += 1
+
+    @property
+    def start_time(self) -> float:
+        """The start time of the layer used to clip the layer in the time axis direction."""
+        return self._start_time
+
+    @start_time.setter
+    def start_time(self, value: float) -> None:
+        self._start_time = value
+        LayerItem._timing_revision += 1
+
+    @property
+    def end_time(self) -> float:
+        """The end time of the layer used to clip the layer in the time axis direction."""
+        return self._end_time
+
+    @end_time.setter
+    def end_time(self, value: float) -> None:
+        self._end_time = value
+        LayerItem._timing_revision += 1
+
     @property
     def duration(self) -> float:
         """The duration of the layer item.
@@ -795,9 +921,9 @@ class LayerItem:
         cache: Cache | None = None,
     ) -> np.ndarray:
         # Retrieve layer image
+        # The caller only composites layers active at the given time.
         layer_time = time - self.offset
-        if layer_time < self.start_time or self.end_time <= layer_time:
-            return bg_image
+        assert self.start_time <= layer_time < self.end_time, "Layer is not active at the given time"
         fg_image = self._get_fg_image(time, cache)
         if fg_image is None:
             return bg_image
@@ -808,9 +934,14 @@ class LayerItem:
         if result is None:
             return bg_image
         affine_matrix_fixed, (W, H), (offset_x, offset_y) = result
-        fg_image_transformed = cv2.warpAffine(
-            fg_image, affine_matrix_fixed, dsize=(W, H),
-            flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+        if (W, H) == (fg_image.shape[1], fg_image.shape[0]) and \
+                np.allclose(affine_matrix_fixed, _IDENTITY_AFFINE_MATRIX, rtol=0.0, atol=1e-6):
+            # Skip warping when the layer image is placed at its natural scale on the pixel grid
+            fg_image_transformed = fg_image
+        else:
+            fg_image_transformed = cv2.warpAffine(
+                fg_image, affine_matrix_fixed, dsize=(W, H),
+                flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
 
         # Composite bg_image and fg_image
         bg_image = alpha_composite(
@@ -870,6 +1001,9 @@ def get_affine_matrix(layer_size: tuple[int, int], p: TransformValue) -> np.ndar
     return affine_matrix[:2]
 
 
+_IDENTITY_AFFINE_MATRIX = np.array([[1, 0, 0], [0, 1, 0]], dtype=np.float64)
+
+
 def _get_fixed_affine_matrix(
     fg_image: np.ndarray, p: TransformValue,
     preview_level: int = 1
@@ -934,6 +1068,23 @@ def _get_T2(p: TransformValue, size: tuple[int, int], origin_point: Direction) -
     return T2
 
 
+def _get_common_prefix_length(a: Sequence[Hashable], b: Sequence[Hashable]) -> int:
+    n = min(len(a), len(b))
+    for i in range(n):
+        if not _keys_equal(a[i], b[i]):
+            return i
+    return n
+
+
+def _keys_equal(a: Hashable, b: Hashable) -> bool:
+    # Some layers return keys that cannot be compared with ``==`` (e.g., tuples containing arrays),
+    # so such keys are regarded as different.
+    try:
+        return bool(a == b)
+    except (ValueError, TypeError):
+        return False
+
+
 def _get_scale_by_block(audio_level: Attribute, start_time: float, n_samples: int) -> np.ndarray:
     n_blocks = (n_samples + AUDIO_BLOCK_SIZE - 1) // AUDIO_BLOCK_SIZE
     block_times = start_time + np.arange(n_blocks) * (AUDIO_BLOCK_SIZE / AUDIO_SAMPLING_RATE)
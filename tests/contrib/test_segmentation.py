@@ -0,0 +1,283 @@
+import gc
+import hashlib
+import http.server
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from movis.contrib import segmentation
+from movis.contrib.segmentation import _calculate_digest, _download_and_cache, _download_with_resume
+
+REMOTE_DATA = bytes(range(256)) * 20
+
+
+class RangeRequestHandler(http.server.BaseHTTPRequestHandler):
+    ignore_range = False
+    requests: list = []
+    statuses: list = []
+
+    def do_GET(self):
+        range_header = self.headers.get('Range')
+        type(self).requests.append(range_header)
+        start = 0
+        if range_header is not None and not self.ignore_range:
+            start = int(range_header[len('bytes='):].rstrip('-'))
+            if len(REMOTE_DATA) <= start:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(REMOTE_DATA)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(REMOTE_DATA) - 1}/{len(REMOTE_DATA)}')
+        else:
+            self.send_response(200)
+        body = REMOTE_DATA[start:]
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_response(self, code, message=None):
+        type(self).statuses.append(code)
+        super().send_response(code, message)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    RangeRequestHandler.ignore_range = False
+    RangeRequestHandler.requests = []
+    RangeRequestHandler.statuses = []
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}/model.onnx'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    data = bytes(range(256)) * 41 + b'tail'
+    path = tmp_path / 'data.bin'
+    path.write_bytes(data)
+    return path, data
+
+
+@pytest.mark.parametrize('algorithm', ['md5', 'sha256'])
+def test_calculate_digest(data_file, algorithm):
+    path, data = data_file
+    expected = hashlib.new(algorithm, data).hexdigest()
+    assert _calculate_digest(path, algorithm, chunk_size=1000) == expected
+
+
+@pytest.mark.parametrize('algorithm', ['md5', 'sha256'])
+def test_calculate_digest_without_file_digest(data_file, algorithm, monkeypatch):
+    path, data = data_file
+    monkeypatch.delattr(hashlib, 'file_digest', raising=False)
+    expected = hashlib.new(algorithm, data).hexdigest()
+    assert _calculate_digest(path, algorithm, chunk_size=1000) == expected
+    assert _calculate_digest(path, algorithm, chunk_size=len(data)) == expected
+
+
+def test_calculate_digest_blake3(data_file):
+    blake3 = pytest.importorskip('blake3')
+    path, data = data_file
+    assert _calculate_digest(path, 'blake3') == blake3.blake3(data).hexdigest()
+
+
+def test_default_digest():
+    cls = segmentation.RobustVideoMatting
+    assert cls.default_md5_digest == cls.default_digest
+
+
+def test_ort_type_to_numpy():
+    assert segmentation._ort_type_to_numpy('tensor(float16)') is np.float16
+    assert segmentation._ort_type_to_numpy('tensor(float)') is np.float32
+    with pytest.raises(ValueError, match=r'tensor\(bfloat16\)'):
+        segmentation._ort_type_to_numpy('tensor(bfloat16)')
+
+
+@pytest.mark.parametrize('partial, ignore_range, status', [
+    pytest.param(None, False, 200, id='fresh'),
+    pytest.param(REMOTE_DATA[:1000], False, 206, id='resume'),
+    pytest.param(REMOTE_DATA[:1000], True, 200, id='range_ignored'),
+    pytest.param(REMOTE_DATA, False, 416, id='complete'),
+    pytest.param(REMOTE_DATA + b'extra', False, 416, id='oversized'),
+])
+def test_download_with_resume(tmp_path, server, partial, ignore_range, status):
+    RangeRequestHandler.ignore_range = ignore_range
+    dst_path = tmp_path / 'model.onnx.part'
+    if partial is not None:
+        dst_path.write_bytes(partial)
+    digest = _download_with_resume(server, dst_path, chunk_size=300)
+    assert dst_path.read_bytes() == REMOTE_DATA
+    assert digest == hashlib.md5(REMOTE_DATA).hexdigest()
+    expected_range = None if partial is None else f'bytes={len(partial)}-'
+    assert RangeRequestHandler.requests[0] == expected_range
+    assert RangeRequestHandler.statuses[0] == status
+    if partial is not None and len(REMOTE_DATA) < len(partial):
+        # The oversized partial file is discarded and downloaded again from scratch.
+        assert RangeRequestHandler.requests[1:] == [None]
+        assert RangeRequestHandler.statuses[1:] == [200]
+    else:
+        assert len(RangeRequestHandler.requests) == 1
+
+
+def test_download_and_cache_retries_corrupted_partial(tmp_path, server, monkeypatch):
+    monkeypatch.setattr(Path, 'home', classmethod(lambda cls: tmp_path))
+    cache_dir = tmp_path / '.cache' / 'movis'
+    cache_dir.mkdir(parents=True)
+    (cache_dir / 'model.onnx.part').write_bytes(b'x' * 1000)
+    expected_digest = hashlib.md5(REMOTE_DATA).hexdigest()
+    cache_path = _download_and_cache(server, expected_digest)
+    assert cache_path == cache_dir / 'model.onnx'
+    assert cache_path.read_bytes() == REMOTE_DATA
+    assert not (cache_dir / 'model.onnx.part').exists()
+    assert RangeRequestHandler.requests == ['bytes=1000-', None]
+    assert RangeRequestHandler.statuses == [206, 200]
+
+
+def test_shared_session_is_released(tmp_path):
+    pytest.importorskip('onnxruntime')
+    onnx = pytest.importorskip('onnx')
+    from onnx import TensorProto, helper
+    graph = helper.make_graph(
+        [helper.make_node('Identity', ['x'], ['y'])], 'identity',
+        [helper.make_tensor_value_info('x', TensorProto.FLOAT, [1])],
+        [helper.make_tensor_value_info('y', TensorProto.FLOAT, [1])])
+    model_path = tmp_path / 'identity.onnx'
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)], ir_version=7), str(model_path))
+
+    providers = ('CPUExecutionProvider',)
+    session = segmentation._get_shared_session(str(model_path), providers)
+    assert segmentation._get_shared_session(str(model_path), providers) is session
+    assert (str(model_path), providers) in segmentation._SESSION_CACHE
+    del session
+    gc.collect()
+    assert (str(model_path), providers) not in segmentation._SESSION_CACHE
+
+
+def _reference_alpha_to_uint8(alpha):
+    with np.errstate(invalid='ignore', over='ignore'):
+        return np.clip(alpha * 255, 0, 255).astype(np.uint8)
+
+
+def test_fp16_to_uint8_table():
+    alpha = np.arange(1 << 16, dtype=np.uint16).view(np.float16)
+    # Casting NaN to an integer is platform-defined, so NaNs are excluded.
+    mask = ~np.isnan(alpha)
+    expected = _reference_alpha_to_uint8(alpha)
+    np.testing.assert_array_equal(segmentation._FP16_TO_UINT8[mask], expected[mask])
+
+
+@pytest.mark.parametrize('shape', [(36, 48), (3, 36, 48)])
+@pytest.mark.parametrize('dtype', [np.float16, np.float32])
+def test_alpha_to_uint8(shape, dtype):
+    rng = np.random.default_rng(0)
+    alpha = (rng.random(shape) * 1.4 - 0.2).astype(dtype)
+    dst = rng.integers(0, 256, size=shape + (4,), dtype=np.uint8)
+    rgb = dst[..., :3].copy()
+    expected = _reference_alpha_to_uint8(alpha)
+    out = segmentation._alpha_to_uint8(alpha.copy(), dst[..., 3])
+    assert not out.flags.c_contiguous
+    np.testing.assert_array_equal(dst[..., 3], expected)
+    np.testing.assert_array_equal(dst[..., :3], rgb)
+
+
+@pytest.fixture(scope='module', params=['float16', 'float32'])
+def toy_rvm_file(request, tmp_path_factory):
+    """A tiny ONNX model with the inputs and outputs of RobustVideoMatting.
+
+    ``pha`` is the channel mean of ``src`` and each recurrent state is incremented by one per run.
+    """
+    pytest.importorskip('onnxruntime')
+    onnx = pytest.importorskip('onnx')
+    from onnx import TensorProto, helper
+    elem_type = TensorProto.FLOAT16 if request.param == 'float16' else TensorProto.FLOAT
+    state_names = ['r1', 'r2', 'r3', 'r4']
+    inputs = [helper.make_tensor_value_info('src', elem_type, ['N', 3, 'H', 'W'])]
+    inputs += [helper.make_tensor_value_info(f'{name}i', elem_type, ['N', 'C', 'h', 'w']) for name in state_names]
+    inputs += [helper.make_tensor_value_info('downsample_ratio', TensorProto.FLOAT, [1])]
+    outputs = [helper.make_tensor_value_info(name, elem_type, None) for name in ['fgr', 'pha']]
+    outputs += [helper.make_tensor_value_info(f'{name}o', elem_type, None) for name in state_names]
+    nodes = [
+        helper.make_node('Identity', ['src'], ['fgr']),
+        helper.make_node('ReduceMean', ['src'], ['pha'], axes=[1], keepdims=1)]
+    nodes += [helper.make_node('Add', [f'{name}i', 'one'], [f'{name}o']) for name in state_names]
+    one = helper.make_tensor('one', elem_type, [], [1.0])
+    graph = helper.make_graph(nodes, 'toy_rvm', inputs, outputs, initializer=[one])
+    model_path = tmp_path_factory.mktemp('rvm') / f'toy_rvm_{request.param}.onnx'
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)], ir_version=7), str(model_path))
+    return model_path
+
+
+def _make_rvm(onnx_file, recurrent_state):
+    return segmentation.RobustVideoMatting(
+        onnx_file, recurrent_state=recurrent_state, providers=['CPUExecutionProvider'])
+
+
+@pytest.mark.parametrize('recurrent_state', [True, False])
+@pytest.mark.parametrize('channels', [3, 4])
+def test_rvm_call_batch(toy_rvm_file, recurrent_state, channels):
+    rng = np.random.default_rng(0)
+    N = segmentation.RobustVideoMatting.max_batch_size + 4
+    frames = rng.integers(0, 256, size=(N, 12, 16, channels), dtype=np.uint8)
+    batch = _make_rvm(toy_rvm_file, recurrent_state).call_batch(frames)
+    effect = _make_rvm(toy_rvm_file, recurrent_state)
+    expected = np.stack([effect(frame, i / 30).copy() for i, frame in enumerate(frames)])
+    assert batch.shape == (N, 12, 16, 4)
+    assert batch.dtype == np.uint8
+    np.testing.assert_array_equal(batch, expected)
+    np.testing.assert_array_equal(batch[..., :3], frames[..., :3])
+
+
+@pytest.mark.parametrize('recurrent_state', [True, False])
+def test_rvm_recurrent_state(toy_rvm_file, recurrent_state):
+    onnxruntime = pytest.importorskip('onnxruntime')
+    effect = _make_rvm(toy_rvm_file, recurrent_state)
+    frame = np.zeros((12, 16, 4), dtype=np.uint8)
+    k = 3
+    for i in range(k):
+        effect(frame, i / 30)
+    for state in effect._state:
+        if recurrent_state:
+            # The outputs of the previous run are fed back as the next state.
+            assert isinstance(state, onnxruntime.OrtValue)
+            np.testing.assert_array_equal(state.numpy(), np.full((1, 1, 1, 1), k))
+        else:
+            assert isinstance(state, np.ndarray)
+            np.testing.assert_array_equal(state, np.zeros((1, 1, 1, 1)))
+
+
+def test_rvm_output_buffers(toy_rvm_file):
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 256, size=(3, 12, 16, 4), dtype=np.uint8)
+    inputs = frames.copy()
+    effect = _make_rvm(toy_rvm_file, recurrent_state=False)
+    first = effect(frames[0], 0.0)
+    expected_first = first.copy()
+    second = effect(frames[1], 1 / 30)
+    # Consecutive results are different arrays, and a result stays valid until two calls later.
+    assert second is not first
+    assert not np.shares_memory(first, second)
+    np.testing.assert_array_equal(first, expected_first)
+    effect(frames[2], 2 / 30)
+    np.testing.assert_array_equal(frames, inputs)
+
+
+def test_rvm_frame_size_change(toy_rvm_file):
+    rng = np.random.default_rng(0)
+    effect = _make_rvm(toy_rvm_file, recurrent_state=False)
+    for i, shape in enumerate([(12, 16), (20, 10), (12, 16)]):
+        frame = rng.integers(0, 256, size=shape + (3,), dtype=np.uint8)
+        result = effect(frame, i / 30)
+        assert result.shape == shape + (4,)
+        np.testing.assert_array_equal(result, _make_rvm(toy_rvm_file, recurrent_state=False)(frame, 0.0))
+        np.testing.assert_array_equal(result[..., :3], frame)
+        alpha = frame.mean(axis=2)
+        assert np.abs(result[..., 3].astype(np.float64) - alpha).max() <= 1.5
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import soundfile as sf
+
+from movis.contrib.voicevox import _get_paths, make_voicevox_dataframe
+
+
+def test_get_paths(tmp_path):
+    for name in ['a.wav', 'b.txt', '.wav', 'x.WAV']:
+        (tmp_path / name).write_bytes(b'')
+    (tmp_path / 'd.wav').mkdir()
+    paths = _get_paths(tmp_path, '.wav')
+    assert paths == [tmp_path / 'a.wav']
+    # Same as filtering by ``Path.suffix``, except that directories are skipped.
+    assert paths == sorted(f for f in tmp_path.iterdir() if f.suffix == '.wav' and not f.is_dir())
+    assert _get_paths(str(tmp_path), '.txt') == [tmp_path / 'b.txt']
+
+
+def test_make_voicevox_dataframe(tmp_path):
+    pytest.importorskip('pandas')
+    for name, duration in [('002.wav', 0.5), ('001.wav', 1.0), ('003.wav', 0.25)]:
+        sf.write(str(tmp_path / name), np.zeros(int(8000 * duration)), samplerate=8000)
+    df = make_voicevox_dataframe(tmp_path)
+    assert list(df.columns) == ['start_time', 'end_time', 'audio_file']
+    np.testing.assert_allclose(df['start_time'], [0.0, 1.0, 1.5])
+    np.testing.assert_allclose(df['end_time'], [1.0, 1.5, 1.75])
+    assert list(df['audio_file']) == [str(tmp_path / name) for name in ['001.wav', '002.wav', '003.wav']]
+
+
+def test_make_voicevox_dataframe_empty(tmp_path):
+    pytest.importorskip('pandas')
+    df = make_voicevox_dataframe(tmp_path)
+    assert list(df.columns) == ['start_time', 'end_time', 'audio_file']
+    assert len(df) == 0
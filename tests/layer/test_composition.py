@@ -132,6 +132,9 @@ def test_composition_properties():
     assert scene.size == (640, 480)
     assert scene.duration == 1.0
     assert scene.preview_level == 1
+    assert scene.cache_size_mb == 1024
+    scene.cache_size_mb = 256
+    assert scene.cache_size_mb == 256
 
 
 def test_composition_pop_layer():
@@ -191,6 +194,57 @@ def test_composition_get_key():
     assert key5 is None
 
 
+def test_composition_get_key_after_changing_time_range():
+    scene = Composition(size=(640, 480), duration=1.0)
+    item = scene.add_layer(
+        mv.layer.Rectangle((128, 128), color='#ffffff', duration=0.5),
+        name='layer')
+    assert scene.get_key(0.75)[1] is None
+    item.offset = 0.5
+    assert scene.get_key(0.25)[1] is None
+    assert scene.get_key(0.75)[1] is not None
+    item.end_time = 0.25
+    assert scene.get_key(0.5)[1] is not None
+    assert scene.get_key(0.75)[1] is None
+
+
+def test_composition_reuse_static_layers():
+    def make_scene():
+        scene = Composition(size=(64, 48), duration=1.0)
+        scene.add_layer(mv.layer.Rectangle((64, 48), color='#336699', duration=1.0), name='bg')
+        item = scene.add_layer(mv.layer.Rectangle((16, 16), color='#ffffff', duration=1.0), name='fg', opacity=0.5)
+        item.position.enable_motion().extend([0.0, 1.0], [(0.0, 0.0), (64.0, 48.0)])
+        return scene
+
+    scene = make_scene()
+    for t in np.arange(0.0, 1.0, 0.1):
+        np.testing.assert_array_equal(scene(t), make_scene()(t))
+
+
+def test_composition_with_concatenated_layers():
+    def make_scene():
+        scene = Composition(size=(32, 32), duration=1.0)
+        scene.add_layer(mv.concatenate([
+            mv.layer.Rectangle((32, 32), color='#ff0000', duration=0.5),
+            mv.layer.Rectangle((32, 32), color='#00ff00', duration=0.5)]), name='bg')
+        item = scene.add_layer(mv.layer.Rectangle((8, 8), color='#ffffff', duration=1.0), name='fg', opacity=0.5)
+        item.position.enable_motion().extend([0.0, 1.0], [(0.0, 0.0), (32.0, 32.0)])
+        return scene
+
+    scene = make_scene()
+    for t in [0.0, 0.1, 0.2, 0.6, 0.7]:
+        np.testing.assert_array_equal(scene(t), make_scene()(t))
+
+
+def test_composition_natural_scale_layer():
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, size=(24, 32, 4), dtype=np.uint8)
+    scene = Composition(size=(64, 48), duration=1.0)
+    scene.add_layer(mv.layer.Image(image, duration=1.0), position=(32, 24))
+    expected = mv.imgproc.alpha_composite(np.zeros((48, 64, 4), dtype=np.uint8), image, position=(16, 12))
+    np.testing.assert_array_equal(scene(0.0), expected)
+
+
 def test_composition_preview():
     scene = Composition(size=(640, 480), duration=1.0)
     scene.add_layer(
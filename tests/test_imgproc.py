@@ -1,5 +1,6 @@
 import numpy as np
 import pytest
+from PIL import Image
 
 from movis.enum import BlendingMode, MatteMode
 from movis.imgproc import alpha_composite
@@ -74,3 +75,18 @@ def test_alpha_composite_luminancematte(opacity, blending_mode):
             opacity=opacity, blending_mode=blending_mode, matte_mode=MatteMode.LUMINANCE)
         np.testing.assert_allclose(bg_dst[:, :, 3], 0)
         assert bg_dst.dtype == np.uint8
+
+
+@pytest.mark.parametrize("opacity", [1.0, 0.7, 0.0])
+def test_alpha_composite_normal_matches_pil(opacity):
+    bg = np.random.randint(0, 255, size=(128, 256, 4)).astype(np.uint8)
+    fg = np.random.randint(0, 255, size=(64, 128, 4)).astype(np.uint8)
+    bg[:16, :, 3] = 0
+    fg[:8, :, 3] = 0
+    fg_pil = fg.copy()
+    fg_pil[:, :, 3] = (fg[:, :, 3].astype(np.uint16) * int(np.round(opacity * 255)) // 255).astype(np.uint8)
+    for (x, y) in [(0, 0), (96, 48), (128, 64)]:
+        expected = Image.fromarray(bg)
+        expected.alpha_composite(Image.fromarray(fg_pil), (x, y))
+        bg_dst = alpha_composite(bg.copy(), fg, position=(x, y), opacity=opacity)
+        np.testing.assert_array_equal(np.asarray(expected), bg_dst)